@@ -13,117 +13,380 @@ network_type, number of agents (n_agents), and number of replications.
 Name: Md Mohidul Haque
 """
 
-import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import networkx as nx
 
-""" Agent class. Contains an intependent decision maker within a simulation"""
-class Agent():
-    def __init__(self, S, id_number, choice_function_exponent):
-        """
-        Constructor method.
+""" Numba is optional. If it is available, the time iteration of the 
+    simulation is compiled to native code, otherwise it runs in Python."""
+try:
+    import numba
+except ImportError:
+    numba = None
+
+""" Technology choice of a single agent. Used by Simulation.run if numba is 
+    not available"""
+def _choose_technology(i, indptr, indices, tech_array, choice_weights, 
+                       cumulative_probability, choice_draw):
+    """
+    Function for choosing a technology for agent i to adopt.
 
-        Parameters
-        ----------
-        S : Simulation object
-            The simulation the agent belongs to.
-        id_number : int
-            Unique ID number of the agent.
-        choice_function_exponent : numeric, optional
-            Exponent of the Generalized Eggenberger-Polya process choice 
-            function. Values >1 will lead to winner-take-all dynamics, Values 
-            <1 lead to equalization dynamics. The default is 2.
+    Parameters
+    ----------
+    i : int
+        ID number of the agent.
+    indptr : numpy.ndarray of int
+        CSR index pointer of the network.
+    indices : numpy.ndarray of int
+        CSR neighbor indices of the network.
+    tech_array : numpy.ndarray of int8
+        Technology of each agent, -1 for none.
+    choice_weights : numpy.ndarray of float
+        Choice weight k**choice_function_exponent for every possible number 
+        k of neighbors using a technology.
+    cumulative_probability : numpy.ndarray of float
+        Scratch array with one entry per technology. Overwritten, so that no
+        new arrays are needed for the choice probabilities.
+    choice_draw : float
+        Uniform random number in [0, 1) used to select the technology.
 
-        Returns
-        -------
-        None.
+    Returns
+    -------
+    int
+        New technology, or -1 if no change was possible.
 
-        """
-        self.id_number = id_number
-        self.Simulation = S
-        self.technology = None
-        self.choice_function_exponent = choice_function_exponent
-        
-    def choose(self):
-        """
-        Method for choosing a technology to adopt.
+    """
+    """ Obtain distribution of technologies used by direct neighbors. 
+        Agents without a technology are marked with -1; shifted by one they 
+        are counted in the first bin, which is left out."""
+    neighbor_techs = tech_array[indices[indptr[i]:indptr[i + 1]]]
+    tech_frequency = np.bincount(neighbor_techs + 1, 
+                                 minlength=len(cumulative_probability) + 1)[1:]
+
+    """ Compute choice probabilities based on the distribution in the 
+        immediate neighborhood. The form of the transformation may tend to 
+        the technology used by the majority (if choice_function_exponent > 1)
+        or overrepresent to those used by the minority (if 
+        choice_function_exponent < 1). The weights are looked up in the 
+        table of powers precomputed by the simulation."""
+    np.take(choice_weights, tech_frequency, out=cumulative_probability)
+    np.cumsum(cumulative_probability, out=cumulative_probability)
+    if cumulative_probability[-1] > 0:
+        """ Select a technology. Sampling by locating a uniform draw in the 
+            unnormalized cumulative weights is equivalent to np.random.choice 
+            with normalized probabilities, but much cheaper for a handful of 
+            technologies."""
+        r = choice_draw * cumulative_probability[-1]
+        return int(np.searchsorted(cumulative_probability, r, side="right"))
+    else:
+        """ Report that no change was possible"""
+        return -1
+
+""" Compiled technology choice of a single agent. Used by _run_time_steps"""
+def _choose_technology_compiled(i, indptr, indices, tech_array, 
+                                choice_weights, counts, 
+                                cumulative_probability, choice_draw):
+    """
+    Function for choosing a technology for agent i to adopt with any number
+    of technologies. Same as _choose_technology, written as explicit loops.
 
-        Returns
-        -------
-        int or None
-            Previous technology.
-        int or None
-            New technology.
+    Parameters
+    ----------
+    i : int
+        ID number of the agent.
+    indptr : numpy.ndarray of int
+        CSR index pointer of the network.
+    indices : numpy.ndarray of int
+        CSR neighbor indices of the network.
+    tech_array : numpy.ndarray of int8
+        Technology of each agent, -1 for none.
+    choice_weights : numpy.ndarray of float
+        Choice weight k**choice_function_exponent for every possible number 
+        k of neighbors using a technology.
+    counts : numpy.ndarray of int32
+        Scratch array with one entry per technology. Overwritten.
+    cumulative_probability : numpy.ndarray of float
+        Scratch array with one entry per technology. Overwritten.
+    choice_draw : float
+        Uniform random number in [0, 1) used to select the technology.
 
-        """
-        """ Obtain distribution of technologies used by direct neighbors"""
-        neighbors = self.get_neighbors()
-        tech_list = self.Simulation.get_technologies_list()
-        tech_frequency = {tech: 0 for tech in tech_list}
-        for A in neighbors:
-            tech = A.get_technology()
-            if tech is not None:
-                tech_frequency[tech] += 1
-
-        """ Compute choice probabilities based on the distribution in the 
-            immediate neighborhood. The form of the transformation may tend to 
-            the technology used by the majority (if self.choice_function_exponent > 1)
-            or overrepresent to those used by the minority (if 
-            self.choice_function_exponent < 1)"""
-        tech_probability = [tech_frequency[tech]**self.choice_function_exponent \
-                                                    for tech in tech_list]
-        if np.sum(tech_probability) > 0:
-            """ Select and adopt a technology"""
-            tech_probability = np.asarray(tech_probability) / np.sum(tech_probability)
-            old_tech = self.technology
-            self.technology = np.random.choice(tech_list, p=tech_probability)
-            """ Report the change back"""
-            return old_tech, self.technology
+    Returns
+    -------
+    int
+        New technology, or -1 if no change was possible.
+
+    """
+    """ Count the technologies of the neighbors"""
+    counts[:] = 0
+    for k in range(indptr[i], indptr[i + 1]):
+        tech = tech_array[indices[k]]
+        if tech >= 0:
+            counts[tech] += 1
+    """ Cumulative choice weights"""
+    total = 0.0
+    for j in range(counts.shape[0]):
+        total += choice_weights[counts[j]]
+        cumulative_probability[j] = total
+    if total > 0:
+        """ Select a technology"""
+        r = choice_draw * total
+        new = 0
+        while cumulative_probability[new] <= r:
+            new += 1
+        return new
+    else:
+        return -1
+
+def _choose_technology_three(i, indptr, indices, tech_array, choice_weights, 
+                             choice_draw):
+    """
+    Function for choosing a technology for agent i to adopt, specialized for
+    exactly three technologies (the default). Counts and weights are kept in
+    scalars, so that no arrays are used. Gives the same results as 
+    _choose_technology_compiled.
+
+    Parameters
+    ----------
+    i : int
+        ID number of the agent.
+    indptr : numpy.ndarray of int
+        CSR index pointer of the network.
+    indices : numpy.ndarray of int
+        CSR neighbor indices of the network.
+    tech_array : numpy.ndarray of int8
+        Technology of each agent, -1 for none.
+    choice_weights : numpy.ndarray of float
+        Choice weight k**choice_function_exponent for every possible number 
+        k of neighbors using a technology.
+    choice_draw : float
+        Uniform random number in [0, 1) used to select the technology.
+
+    Returns
+    -------
+    int
+        New technology, or -1 if no change was possible.
+
+    """
+    c0 = 0
+    c1 = 0
+    c2 = 0
+    for k in range(indptr[i], indptr[i + 1]):
+        tech = tech_array[indices[k]]
+        if tech == 0:
+            c0 += 1
+        elif tech == 1:
+            c1 += 1
+        elif tech == 2:
+            c2 += 1
+    p0 = choice_weights[c0]
+    p1 = p0 + choice_weights[c1]
+    total = p1 + choice_weights[c2]
+    if total > 0:
+        """ The new technology is the number of cumulative weights not 
+            exceeding the scaled draw"""
+        r = choice_draw * total
+        return int(p0 <= r) + int(p1 <= r)
+    else:
+        return -1
+
+if numba is not None:
+    _choose_technology_compiled = numba.njit(cache=True)(_choose_technology_compiled)
+    _choose_technology_three = numba.njit(cache=True)(_choose_technology_three)
+
+""" Compiled time iteration. Used by Simulation.run if numba is available"""
+def _run_time_steps(indptr, indices, tech_array, tech_frequency, history, 
+                    agent_ids, reconsideration_draws, choice_draws, 
+                    choice_weights, reconsideration_probability):
+    """
+    Function running the time iteration of a simulation on the CSR network 
+    and technology arrays. Follows the same steps as Simulation.run and 
+    _choose_technology. With three technologies, the specialized 
+    _choose_technology_three is used.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray of int
+        CSR index pointer of the network.
+    indices : numpy.ndarray of int
+        CSR neighbor indices of the network.
+    tech_array : numpy.ndarray of int8
+        Technology of each agent, -1 for none. Modified in place.
+    tech_frequency : numpy.ndarray of int32
+        Number of users of each technology. Modified in place.
+    history : numpy.ndarray of int
+        Array of shape (t_max+2, n_technologies) with the initial counts in 
+        the first row, in which the technology counts are recorded, or of 
+        shape (0, n_technologies) to skip recording. Modified in place.
+    agent_ids : numpy.ndarray of int
+        Agent selected in each time period.
+    reconsideration_draws : numpy.ndarray of float
+        Uniform random number of each time period deciding whether the 
+        selected agent reconsiders.
+    choice_draws : numpy.ndarray of float
+        Uniform random number of each time period used to select the new 
+        technology.
+    choice_weights : numpy.ndarray of float
+        Choice weight k**choice_function_exponent for every possible number 
+        k of neighbors using a technology.
+    reconsideration_probability : float
+        Probability for agents that have already chosen to reconsider.
+
+    Returns
+    -------
+    numpy.ndarray of int8
+        Final technology of each agent.
+
+    """
+    n_technologies = tech_frequency.shape[0]
+    record_history = history.shape[0] > 0
+    """ The counts only change on adoption; history rows are filled up to 
+        the period of each change instead of in every period"""
+    filled = 1
+    counts = np.zeros(n_technologies, dtype=np.int32)
+    cumulative_probability = np.zeros(n_technologies, dtype=np.float64)
+    for t in range(agent_ids.shape[0]):
+        i = agent_ids[t]
+        old = tech_array[i]
+        if (old >= 0) and (reconsideration_draws[t] >= reconsideration_probability):
+            """ Nothing to do if the agent keeps their technology"""
+            continue
+        if n_technologies == 3:
+            new = _choose_technology_three(i, indptr, indices, tech_array, 
+                                           choice_weights, choice_draws[t])
         else:
-            """ Report that no change was possible"""
-            return None, None
-        
-    def get_technology(self):
-        """
-        Getter method for the technology the agent uses.
+            new = _choose_technology_compiled(i, indptr, indices, tech_array, 
+                                              choice_weights, counts, 
+                                              cumulative_probability, 
+                                              choice_draws[t])
+        if new >= 0:
+            """ Record the state up to now, then adopt the technology"""
+            if record_history:
+                for row in range(filled, t + 1):
+                    history[row, :] = tech_frequency
+                filled = t + 1
+            tech_array[i] = new
+            if old >= 0:
+                tech_frequency[old] -= 1
+            tech_frequency[new] += 1
+    if record_history:
+        for row in range(filled, history.shape[0]):
+            history[row, :] = tech_frequency
+    return tech_array
+
+if numba is not None:
+    _run_time_steps = numba.njit(cache=True)(_run_time_steps)
+
+""" Compiled batch of replications on a shared network. Used by 
+    Experiment.run if numba is available and the network is reused. Once it 
+    has run, its threads are alive and the process must not be forked 
+    (the threading layer, e.g. TBB, can hang at exit); this is recorded in 
+    _parallel_threads_started."""
+_parallel_threads_started = False
+
+def _run_replications(indptr, indices, tech_arrays, tech_frequencies, 
+                      agent_ids, reconsideration_draws, choice_draws, 
+                      choice_weights, reconsideration_probability):
+    """
+    Function running independent replications on one network in parallel 
+    threads. Each replication runs _run_time_steps on its own row of the 
+    given arrays. The seeding and random numbers are prepared by 
+    Simulation, so that the results are the same as with Simulation.run.
 
-        Returns
-        -------
-        int
-            Current technology. The technologies are characterized as ints.
+    Parameters
+    ----------
+    indptr : numpy.ndarray of int
+        CSR index pointer of the shared network.
+    indices : numpy.ndarray of int
+        CSR neighbor indices of the shared network.
+    tech_arrays : numpy.ndarray of int8
+        Technology of each agent (columns) in each replication (rows), -1 
+        for none. Modified in place.
+    tech_frequencies : numpy.ndarray of int32
+        Number of users of each technology (columns) in each replication 
+        (rows). Modified in place.
+    agent_ids : numpy.ndarray of int
+        Agent selected in each time period (columns) of each replication 
+        (rows).
+    reconsideration_draws : numpy.ndarray of float
+        Reconsideration random numbers, arranged as agent_ids.
+    choice_draws : numpy.ndarray of float
+        Technology choice random numbers, arranged as agent_ids.
+    choice_weights : numpy.ndarray of float
+        Choice weight k**choice_function_exponent for every possible number 
+        k of neighbors using a technology.
+    reconsideration_probability : float
+        Probability for agents that have already chosen to reconsider.
 
-        """
-        return self.technology
-        
-    def set_technology(self, tech):
-        """
-        Setter method for the technology the agent uses.
+    Returns
+    -------
+    None.
 
-        Parameters
-        ----------
-        tech : int
-            New technology the agent should adopt. The technologies are 
-            characterized as ints.
+    """
+    n_technologies = tech_frequencies.shape[1]
+    for rep in numba.prange(tech_arrays.shape[0]):
+        _run_time_steps(indptr, indices, tech_arrays[rep], 
+                        tech_frequencies[rep], 
+                        np.zeros((0, n_technologies), dtype=np.int32), 
+                        agent_ids[rep], reconsideration_draws[rep], 
+                        choice_draws[rep], choice_weights, 
+                        reconsideration_probability)
 
-        Returns
-        -------
-        None.
+if numba is not None:
+    _run_replications = numba.njit(parallel=True, cache=True)(_run_replications)
 
-        """
-        self.technology = tech
-        
-        
-    def get_neighbors(self):
-        """
-        Method for returning a list of neighbor agents
 
-        Returns
-        -------
-        List of Agent objects:
-            List of Agents that are direct neighbors
-        """
-        return [self.Simulation.G.nodes[N]["agent"] for N in \
-                        nx.neighbors(self.Simulation.G, self.id_number)]
+""" Functions for generating networks"""
+
+def generate_network(network_type, n_agents, seed=None):
+    """
+    Function for generating the network the agents are placed on
+
+    Parameters
+    ----------
+    network_type : str
+        Network type. Can be Erdos-Renyi, Barabasi-Albert, or Watts-Strogatz.
+    n_agents : int
+        Number of agents (nodes).
+    seed : int or None, optional
+        Seed for the random network generator. The default is None.
+
+    Returns
+    -------
+    networkx.Graph
+        Generated network.
+    """
+    """ fast_gnp_random_graph samples the same G(n, p) model as 
+        erdos_renyi_graph in O(n+m) instead of O(n^2) time."""
+    if network_type == "Erdos-Renyi":
+        return nx.fast_gnp_random_graph(n=n_agents, p=0.1, seed=seed)
+    elif network_type == "Barabasi-Albert":
+        return nx.barabasi_albert_graph(n=n_agents, m=40, seed=seed)
+    elif network_type == "Watts-Strogatz":
+        return nx.connected_watts_strogatz_graph(n=n_agents, k=40, p=0.15, 
+                                                 seed=seed)
+    else:
+        assert False, "Unknown network type {:s}".format(network_type)
+
+def network_to_csr(G):
+    """
+    Function for converting a network to a CSR adjacency structure
+
+    Parameters
+    ----------
+    G : networkx.Graph
+        Network with nodes 0, ..., n-1.
+
+    Returns
+    -------
+    numpy.ndarray of int
+        CSR index pointer. The neighbors of node i are 
+        indices[indptr[i]:indptr[i+1]].
+    numpy.ndarray of int
+        CSR neighbor indices.
+    """
+    adjacency = nx.to_scipy_sparse_array(G, format="csr", dtype=np.int8)
+    return adjacency.indptr, adjacency.indices
+
 
 """ Simulation class. Contains the entire run of one simulation for one 
     parameter setting.
@@ -136,7 +399,10 @@ class Simulation():
                  reconsideration_probability=0.2, 
                  choice_function_exponent=2, 
                  network_type="Erdos-Renyi",
-                 t_max=5000):
+                 t_max=5000,
+                 record_history=True,
+                 seed=None,
+                 precomputed_csr=None):
         """
         Constructor method.
 
@@ -160,6 +426,18 @@ class Simulation():
             The default is "Erdos-Renyi".
         t_max : int, optional
             Number of time periods. The default is 5000.
+        record_history : bool, optional
+            Should the technology frequencies be recorded in every time 
+            period. If False, only the final state is kept. The default is 
+            True.
+        seed : int or None, optional
+            Seed for the random number generator of the simulation. If None, 
+            it is drawn from NumPy's global random state, so that 
+            np.random.seed also fixes the simulation. The default is None.
+        precomputed_csr : tuple of numpy.ndarray or None, optional
+            CSR index pointer and neighbor indices of a network as returned 
+            by network_to_csr. If given, no network is generated and 
+            network_type is ignored. The default is None.
 
         Returns
         -------
@@ -173,47 +451,64 @@ class Simulation():
         self.n_initial_adopters = n_initial_adopters        
         self.reconsideration_probability = reconsideration_probability  
         self.choice_function_exponent = choice_function_exponent
+        self.record_history = record_history
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        self.rng = np.random.default_rng(seed)
         
         """ Prepare technology list"""
         self.technologies_list = list(range(self.n_technologies))
-        """ Prepare technology frequency dict. Each technology initialized with
-            number zero."""
-        self.tech_frequency = {tech: 0 for tech in self.technologies_list}
         
-        """ Generate network"""
-        if network_type == "Erdos-Renyi":
-            self.G = nx.erdos_renyi_graph(n=self.n_agents, p=0.1)
-        elif network_type == "Barabasi-Albert":
-            self.G = nx.barabasi_albert_graph(n=self.n_agents, m=40)
-        elif network_type == "Watts-Strogatz":
-            self.G = nx.connected_watts_strogatz_graph(n=self.n_agents, k=40, p=0.15)
-        else:
-            assert False, "Unknown network type {:s}".format(network_type)
+        """ Generate network, unless one is given, and store it as a CSR 
+            adjacency structure. The neighbors of agent i are 
+            indices[indptr[i]:indptr[i+1]]. The NetworkX graph itself is not 
+            kept; all neighbor queries use the CSR arrays."""
+        if precomputed_csr is None:
+            precomputed_csr = network_to_csr(generate_network(
+                                    network_type, self.n_agents, 
+                                    seed=int(self.rng.integers(2**31 - 1))))
+        self.indptr, self.indices = precomputed_csr
         
-        """ Create agents and place them on the network"""
-        self.agents_list = []
+        """ Precompute the choice weights k**choice_function_exponent for 
+            every possible number k of neighbors using a technology, so that 
+            no powers are computed in the time iteration"""
+        max_degree = int(np.diff(self.indptr).max(initial=0))
+        self.choice_weights = np.arange(max_degree + 1, dtype=np.float64) \
+                                            ** self.choice_function_exponent
         
-        for i in range(self.G.order()):
-            A = Agent(self, i, self.choice_function_exponent)
-            self.agents_list.append(A)
-            self.G.nodes[i]["agent"] = A
+        """ Technologies of all agents in one array; -1 means no technology. 
+            int8 keeps the array small, since it is read for every neighbor 
+            in the time iteration."""
+        assert self.n_technologies <= np.iinfo(np.int8).max, \
+            "At most {:d} technologies supported".format(np.iinfo(np.int8).max)
+        self.tech_array = np.full(self.n_agents, -1, dtype=np.int8)
         
-        """ Seed technologies in random agents"""
+        """ Seed technologies in random agents. Each technology is assigned to
+            self.n_initial_adopters distinct agents."""
         n_early_adopters = self.n_technologies*self.n_initial_adopters
-        early_adopters = list(np.random.choice(self.agents_list, 
-                                               replace=False, 
-                                               size=n_early_adopters))
-        for i in range(self.n_technologies):
-            for j in range(self.n_initial_adopters):
-                A = early_adopters.pop()
-                A.set_technology(self.technologies_list[i])
-            self.tech_frequency[i] += self.n_initial_adopters
+        early_adopters = self.rng.choice(self.n_agents, replace=False, 
+                                         size=n_early_adopters)
+        self.tech_array[early_adopters] = np.repeat(
+                                            np.arange(self.n_technologies), 
+                                            self.n_initial_adopters)
+        
+        """ Prepare technology frequency counters from the seeded agents"""
+        self.tech_frequency = np.bincount(
+                                self.tech_array[self.tech_array >= 0], 
+                                minlength=self.n_technologies).astype(np.int32)
         
-        """ Prepare history variables and record initial values"""
-        self.history_tech_frequency = {tech: \
-                                [self.tech_frequency[tech] / self.n_agents] \
-                                for tech in self.technologies_list}
-        self.history_t = [0]
+        """ Prepare history variables and record initial values. The history 
+            is preallocated and holds integer counts; these are converted to 
+            frequencies only once in return_results. Only the first 
+            self.history_length rows are valid; the rest is written by run, 
+            so the array need not be initialized."""
+        if self.record_history:
+            self.history_tech_frequency = np.empty((self.t_max + 2, 
+                                                    self.n_technologies), 
+                                                   dtype=np.int32)
+            self.history_tech_frequency[0] = self.tech_frequency
+            self.history_length = 1
+            self.history_t = np.concatenate(([0], np.arange(self.t_max + 1)))
 
     def run(self):
         """
@@ -224,25 +519,78 @@ class Simulation():
         None.
 
         """
+        agent_ids, reconsideration_draws, choice_draws = \
+                                                    self.draw_random_numbers()
+        
+        if numba is not None:
+            """ Run the compiled time iteration"""
+            if self.record_history:
+                history = self.history_tech_frequency
+            else:
+                history = np.zeros((0, self.n_technologies), dtype=np.int32)
+            _run_time_steps(self.indptr, self.indices, self.tech_array, 
+                            self.tech_frequency, history, agent_ids, 
+                            reconsideration_draws, choice_draws, 
+                            self.choice_weights, 
+                            float(self.reconsideration_probability))
+            self.history_length = self.t_max + 2
+            return
+        
+        """ Scratch array for the choice probabilities, reused in every step"""
+        cumulative_probability = np.zeros(self.n_technologies, dtype=np.float64)
+        """ The counts only change on adoption; history rows are filled up to 
+            the period of each change instead of in every period"""
+        filled = 1
+        
         """ Time iteration"""
         for t in range(0, self.t_max + 1):
             """ Select one agent in each time step"""
-            A = np.random.choice(self.agents_list)
+            i = agent_ids[t]
             """ The agent will choose a technology if they have none, otherwise
-                they may reconsider depending on self.reconsideration_probability"""
-            tech = A.get_technology()
-            if (tech is None) or \
-                    (np.random.random() < self.reconsideration_probability):
-                old, new = A.choose()
-                if old is not None:
+                they may reconsider depending on self.reconsideration_probability.
+                Nothing to do if the agent keeps their technology."""
+            old = self.tech_array[i]
+            if (old >= 0) and \
+                    (reconsideration_draws[t] >= self.reconsideration_probability):
+                continue
+            new = _choose_technology(i, self.indptr, self.indices, 
+                                     self.tech_array, self.choice_weights, 
+                                     cumulative_probability, choice_draws[t])
+            if new >= 0:
+                """ Record the state up to now, then adopt the technology"""
+                if self.record_history:
+                    self.history_tech_frequency[filled:t + 1] = self.tech_frequency
+                    filled = t + 1
+                self.tech_array[i] = new
+                if old >= 0:
                     self.tech_frequency[old] -= 1
-                if new is not None:
-                    self.tech_frequency[new] += 1
-            """ Record current state"""
-            for i in range(self.n_technologies):
-                self.history_tech_frequency[i].append( \
-                                    self.tech_frequency[i] / self.n_agents)
-            self.history_t.append(t)
+                self.tech_frequency[new] += 1
+        
+        """ Record the final state"""
+        if self.record_history:
+            self.history_tech_frequency[filled:] = self.tech_frequency
+        self.history_length = self.t_max + 2
+
+    def draw_random_numbers(self):
+        """
+        Method drawing the agents selected in each time period and the random
+        numbers deciding about reconsideration and the new technology for all 
+        periods at once.
+
+        Returns
+        -------
+        numpy.ndarray of int
+            Agent selected in each time period.
+        numpy.ndarray of float
+            Uniform random numbers deciding whether the agent reconsiders.
+        numpy.ndarray of float
+            Uniform random numbers used to select the new technology.
+
+        """
+        agent_ids = self.rng.integers(0, self.n_agents, size=self.t_max + 1)
+        reconsideration_draws = self.rng.random(self.t_max + 1)
+        choice_draws = self.rng.random(self.t_max + 1)
+        return agent_ids, reconsideration_draws, choice_draws
 
     def get_technologies_list(self):
         """
@@ -256,6 +604,19 @@ class Simulation():
         """
         return self.technologies_list
 
+    def final_market_shares(self):
+        """
+        Method for returning the market shares in the current (after run, the
+        final) period directly from the technology counters.
+
+        Returns
+        -------
+        numpy.ndarray of float
+            Market share of each technology.
+
+        """
+        return self.tech_frequency / self.n_agents
+
     def return_results(self, show_plot=False):
         """
         Method for returning and visualizing results
@@ -272,17 +633,33 @@ class Simulation():
 
         """
 
+        """ Convert recorded counts to frequencies. Without a recorded history
+            only the final period is returned."""
+        if self.record_history:
+            history_t = self.history_t[:self.history_length]
+            history_shares = self.history_tech_frequency[:self.history_length] \
+                                                                / self.n_agents
+        else:
+            history_t = np.array([self.t_max])
+            history_shares = self.tech_frequency[np.newaxis, :] / self.n_agents
+        
         """ Prepare return dict"""
-        simulation_history = {"history_t": self.history_t,
-                              "history_tech_frequency": self.history_tech_frequency}
+        history_tech_frequency = {tech: history_shares[:, tech] \
+                                  for tech in self.technologies_list}
+        simulation_history = {"history_t": history_t,
+                              "history_tech_frequency": history_tech_frequency}
         
         if show_plot:
+            """ matplotlib is only imported when plotting, which keeps it out 
+                of the start-up of simulations and worker processes"""
+            import matplotlib.pyplot as plt
+            
             """ Create figure showing the development of usage shares of the 
                 technologies"""
             fig, ax = plt.subplots(nrows=1, ncols=1, squeeze=False)
-            for tech in self.history_tech_frequency.keys():
-                ax[0][0].plot(self.history_t, 
-                              self.history_tech_frequency[tech], 
+            for tech in history_tech_frequency.keys():
+                ax[0][0].plot(history_t, 
+                              history_tech_frequency[tech], 
                               label="Technology "+str(tech))
             ax[0][0].set_ylim(0, 1)
             ax[0][0].set_xlim(0, self.t_max+1)
@@ -298,9 +675,78 @@ class Simulation():
         return simulation_history
 
 
+""" Single replication. Module level, so that it can be sent to worker 
+    processes"""
+def _run_one(args):
+    """
+    Function creating and running one replication of the experiment.
+
+    Parameters
+    ----------
+    args : tuple
+        Network type (str), number of agents (int), random seed (int) of the
+        replication, and CSR adjacency structure of a shared network (tuple 
+        of numpy.ndarray or None).
+
+    Returns
+    -------
+    float
+        Largest and Second Largest market share at the end of the simulation.
+    """
+    network_type, agent_number, seed, csr = args
+    S = Simulation(network_type = network_type, n_agents = agent_number, 
+                   record_history = False, seed = seed, precomputed_csr = csr)
+    S.run()
+    
+    """ Compute statistics (largest and Second-Largest market shares) from 
+        the market shares in the last period"""
+    return largest_and_second_largest_MS(S.final_market_shares())
+
+""" CSR adjacency structure of the network shared by the replications in a 
+    worker process. Set once per worker by _init_worker, so that it is not 
+    sent with every replication."""
+_shared_csr = None
+
+def _init_worker(csr):
+    """
+    Initializer of worker processes, storing the shared network.
+
+    Parameters
+    ----------
+    csr : tuple of numpy.ndarray or None
+        CSR adjacency structure of the shared network, or None if every 
+        replication generates its own network.
+
+    Returns
+    -------
+    None.
+    """
+    global _shared_csr
+    _shared_csr = csr
+
+def _run_one_shared(args):
+    """
+    Function running one replication in a worker process on the network set
+    by _init_worker.
+
+    Parameters
+    ----------
+    args : tuple
+        Network type (str), number of agents (int), and random seed (int) 
+        of the replication.
+
+    Returns
+    -------
+    float
+        Largest and Second Largest market share at the end of the simulation.
+    """
+    return _run_one(args + (_shared_csr,))
+
+
 """ Class of verifiable simulations, returning reproducible statistical results"""
 class Experiment():
-    def __init__(self, network_type="Erdos-Renyi", agent_number=100, number_of_replications=100):
+    def __init__(self, network_type="Erdos-Renyi", agent_number=100, number_of_replications=100, 
+                 processes=None, reuse_graph=False):
         """
         Constructor method.
 
@@ -313,6 +759,18 @@ class Experiment():
             Number of agents in each simulation. The default value is 1000.
         number_of_replications: int, optional
             Number of replications. The default is 100.
+        processes: int or None, optional
+            Number of worker processes (or threads, for compiled 
+            replications on a reused network) running replications in 
+            parallel. None uses all CPU cores, except that compiled 
+            replications on fresh networks run in this process, since they 
+            are faster than starting workers. 1 always runs in this 
+            process. The default is None.
+        reuse_graph: bool, optional
+            Should all replications run on one network sample instead of 
+            generating a new network for each replication. The technology 
+            seeding and the time iteration are still random. The default is 
+            False.
 
         Returns
         -------
@@ -322,6 +780,8 @@ class Experiment():
         self.network_type = network_type
         self.agent_number = agent_number
         self.number_of_replications = number_of_replications
+        self.processes = processes
+        self.reuse_graph = reuse_graph
         self.list_largest_m_shares = []
         self.list_second_largest_m_shares = []
         
@@ -339,30 +799,97 @@ class Experiment():
 
         """
         
-        for i in range(self.number_of_replications):
-            """ Create and run one replication at a time."""
-            """ To save time we can adjust the size of the simulations here
-                (lowering the number of time periods and agents compared to 
-                the default). Note that this changes the experiment and 
-                therefore also the results."""
-            S = Simulation(network_type = self.network_type, n_agents = self.agent_number)
-            S.run()
-            results = S.return_results()
-
-            """ Extract market shares in the last period from result variable"""
-            history_market_shares = results["history_tech_frequency"]
-            market_shares = []
-            for key in history_market_shares.keys():
-                history = history_market_shares[key]
-                ms = history[-1]
-                market_shares.append(ms)
+        """ Draw a distinct seed for every replication from NumPy's global 
+            random state, so that the experiment can be reproduced with 
+            np.random.seed regardless of the number of processes."""
+        base_seed = np.random.randint(2**31 - self.number_of_replications)
+        
+        """ Generate the shared network only once if it is reused"""
+        if self.reuse_graph:
+            csr = network_to_csr(generate_network(self.network_type, 
+                                                  self.agent_number, 
+                                                  seed=np.random.randint(2**31 - 1)))
+        else:
+            csr = None
+        
+        if self.reuse_graph and numba is not None:
+            """ Run all replications in one compiled call using parallel 
+                threads. Each replication is set up as a Simulation with the 
+                same seed _run_one would use, so that the results do not 
+                depend on whether numba is available."""
+            simulations = [Simulation(n_agents = self.agent_number, 
+                                      record_history = False, 
+                                      seed = base_seed + i, 
+                                      precomputed_csr = csr) \
+                           for i in range(self.number_of_replications)]
+            draws = [S.draw_random_numbers() for S in simulations]
+            tech_arrays = np.stack([S.tech_array for S in simulations])
+            tech_frequencies = np.stack([S.tech_frequency for S in simulations])
             
-            """ Compute statistics (largest and Second-Largest market shares)"""
-            lms, slms = largest_and_second_largest_MS(market_shares)
+            """ The thread count is limited to what numba has launched and 
+                restored afterwards, so it does not carry over to later runs. 
+                Note: once these threads run, the process must not be forked 
+                (the threading layer, e.g. TBB, can hang at exit); worker 
+                pools created afterwards therefore use the spawn start 
+                method."""
+            global _parallel_threads_started
+            _parallel_threads_started = True
+            previous_threads = numba.get_num_threads()
+            if self.processes is not None:
+                numba.set_num_threads(min(self.processes, 
+                                          numba.config.NUMBA_NUM_THREADS))
+            try:
+                _run_replications(csr[0], csr[1], tech_arrays, 
+                                  tech_frequencies, 
+                                  np.stack([d[0] for d in draws]), 
+                                  np.stack([d[1] for d in draws]), 
+                                  np.stack([d[2] for d in draws]), 
+                                  simulations[0].choice_weights, 
+                                  float(simulations[0].reconsideration_probability))
+            finally:
+                numba.set_num_threads(previous_threads)
             
             """ Collect results into class level lists"""
-            self.list_largest_m_shares.append(lms)
-            self.list_second_largest_m_shares.append(slms)
+            for tech_frequency in tech_frequencies:
+                lms, slms = largest_and_second_largest_MS(tech_frequency / 
+                                                          self.agent_number)
+                self.list_largest_m_shares.append(lms)
+                self.list_second_largest_m_shares.append(slms)
+            return
+        
+        replications = [(self.network_type, self.agent_number, base_seed + i, csr) \
+                        for i in range(self.number_of_replications)]
+        
+        """ Compiled replications take milliseconds; starting worker processes
+            (which import numpy, networkx, scipy, and numba) costs more than 
+            it saves, unless more processes were asked for explicitly"""
+        if (self.processes == 1) or \
+                (numba is not None and self.processes is None):
+            for lms, slms in map(_run_one, replications):
+                """ Collect results into class level lists"""
+                self.list_largest_m_shares.append(lms)
+                self.list_second_largest_m_shares.append(slms)
+            return
+        
+        """ Replications are independent and run in parallel. To save time we 
+            can adjust the size of the simulations in _run_one (lowering the 
+            number of time periods and agents compared to the default). Note 
+            that this changes the experiment and therefore also the results. 
+            The platform's default start method is used, unless the parallel 
+            numba threads have been started, after which forking can hang the 
+            interpreter. A shared network is sent to each worker once by the 
+            initializer; the tasks only carry the seeds."""
+        if _parallel_threads_started:
+            context = multiprocessing.get_context("spawn")
+        else:
+            context = multiprocessing.get_context()
+        tasks = [replication[:3] for replication in replications]
+        with context.Pool(processes=self.processes, initializer=_init_worker, 
+                          initargs=(csr,)) as pool:
+            for lms, slms in pool.imap(_run_one_shared, tasks):
+                """ Collect results into class level lists"""
+                self.list_largest_m_shares.append(lms)
+                self.list_second_largest_m_shares.append(slms)
         
     def collect_results(self):
         """
@@ -403,6 +930,7 @@ class Experiment():
             """
             ploting highest and second highest market shares
             """
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots(nrows = 1, ncols = 1, squeeze = False)
             ax[0][0].hist(self.list_largest_m_shares, bins = 15, color = 'b', alpha = 0.6, rwidth = 0.85, label = 'Largest MS')
             ax[0][0].hist(self.list_second_largest_m_shares, bins = 15, color = 'g', alpha = 0.6, rwidth = 0.85, label = 'Second_Largest MS')
@@ -430,7 +958,12 @@ def largest_and_second_largest_MS(market_share):
     float
         largest and Second Largest market share.
     """
-    market_share = np.sort(market_share)
+    if len(market_share) <= 8:
+        """ For a handful of technologies sorting in Python is cheapest"""
+        market_share = sorted(market_share, reverse=True)
+        return market_share[0], market_share[1]
+    """ Otherwise only the two largest values are put in place (O(k))"""
+    market_share = np.partition(np.asarray(market_share), -2)
     return market_share[-1], market_share[-2]
 
 